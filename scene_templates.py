@@ -0,0 +1,321 @@
+import logging
+import math
+
+# Pre-validated, parameterized Manim scene templates. Each template turns a
+# script segment with a known "segment_type" into the source of one method of
+# ExplanationScene, so common segments are rendered without asking Gemini for
+# free-form code.
+
+logger = logging.getLogger(__name__)
+
+CUSTOM_SEGMENT_TYPE = "custom"
+MAX_LIST_ITEMS = 8
+MAX_DIAGRAM_SHAPES = 5
+MAX_PROCESS_STEPS = 6
+CLEAR_RUN_TIME = 0.5
+MIN_RUN_TIME = 0.3
+MIN_WAIT_TIME = 0.1
+
+COLORS = {
+    "white": "WHITE",
+    "blue": "BLUE",
+    "green": "GREEN",
+    "red": "RED",
+    "yellow": "YELLOW",
+    "orange": "ORANGE",
+    "purple": "PURPLE",
+    "teal": "TEAL",
+}
+DEFAULT_COLOR_CYCLE = ["BLUE", "GREEN", "ORANGE", "PURPLE", "TEAL", "RED"]
+
+SHAPES = {
+    "circle": "Circle(radius=0.8, color={color})",
+    "square": "Square(side_length=1.6, color={color})",
+    "rectangle": "Rectangle(width=2.2, height=1.4, color={color})",
+    "triangle": "Triangle(color={color}).scale(0.9)",
+    "dot": "Dot(radius=0.15, color={color})",
+}
+
+SCENE_HEADER = '''from manim import (
+    Scene, VGroup, Text, MathTex, TexTemplate, Circle, Square, Rectangle, Triangle, Dot, Line,
+    Create, Write, FadeIn, FadeOut, UP, DOWN, LEFT, RIGHT, ORIGIN,
+    WHITE, BLUE, GREEN, RED, YELLOW, ORANGE, PURPLE, TEAL,
+)
+
+
+def _fit(mobject, max_width=12.5, max_height=6.0):
+    """Scale a mobject down so it stays inside the visible frame."""
+    if mobject.width > max_width:
+        mobject.scale_to_fit_width(max_width)
+    if mobject.height > max_height:
+        mobject.scale_to_fit_height(max_height)
+    return mobject
+
+
+def _clear(scene):
+    """Fade out everything on screen before the next segment starts."""
+    if scene.mobjects:
+        scene.play(*[FadeOut(mobject) for mobject in scene.mobjects], run_time=%s)
+''' % CLEAR_RUN_TIME
+
+SEGMENT_TYPES = {
+    "title_card": 'a large title with an optional subtitle. Parameters: {"title": str, "subtitle": str (optional)}',
+    "bullet_list": 'bullet points revealed one by one. Parameters: {"heading": str (optional), "items": [str, ...] (1 to %d items)}' % MAX_LIST_ITEMS,
+    "equation": 'an equation reveal. Parameters: {"latex": str (LaTeX math, no $ delimiters), "plain_text": str (plain text version of the equation), "caption": str (optional)}',
+    "shapes_diagram": 'labelled basic shapes side by side. Parameters: {"heading": str (optional), "shapes": [{"shape": one of %s, "label": str (optional), "color": one of %s (optional)}, ...] (1 to %d shapes)}' % (
+        ", ".join(SHAPES), ", ".join(COLORS), MAX_DIAGRAM_SHAPES),
+    "process_steps": 'a step-by-step process shown as connected boxes. Parameters: {"heading": str (optional), "steps": [str, ...] (2 to %d steps)}' % MAX_PROCESS_STEPS,
+}
+
+def describe_segment_types(indent=""):
+    """Describe the available segment types for the script generation prompt."""
+    lines = [f'{indent}- "{name}": {description}' for name, description in SEGMENT_TYPES.items()]
+    lines.append(f'{indent}- "{CUSTOM_SEGMENT_TYPE}": anything the types above cannot show. Parameters: {{}}')
+    return "\n".join(lines)
+
+def _displayable(value, key):
+    """Return a text or number value as a stripped string, rejecting anything else."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(f"parameter '{key}' must be text, got {type(value).__name__}")
+    return str(value).strip()
+
+def _text(params, key, required=True):
+    """Return a stripped string parameter, or None when an optional one is missing."""
+    value = params.get(key)
+    text = "" if value is None else _displayable(value, key)
+    if not text:
+        if required:
+            raise ValueError(f"missing parameter '{key}'")
+        return None
+    return text
+
+def _text_list(params, key, min_items, max_items):
+    """Return a list parameter as stripped strings, validating its length."""
+    values = params.get(key)
+    if not isinstance(values, list):
+        raise ValueError(f"parameter '{key}' must be a list")
+    values = [text for text in (_displayable(value, key) for value in values) if text]
+    if not min_items <= len(values) <= max_items:
+        raise ValueError(f"parameter '{key}' must have {min_items} to {max_items} entries")
+    return values
+
+def _duration(value, max_duration):
+    """Return a segment duration as a finite number of seconds, capped at max_duration."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError("duration_seconds must be a number")
+    duration = float(value)
+    if not math.isfinite(duration) or duration <= 0:
+        raise ValueError(f"duration_seconds must be a positive finite number, got {value!r}")
+    return min(duration, max_duration)
+
+def _timing(duration, animation_count):
+    """Split a segment duration into a per-animation run time and a closing wait.
+
+    Raises ValueError when the animations cannot fit, so the segment never runs past
+    its narration.
+    """
+    available = duration - CLEAR_RUN_TIME - MIN_WAIT_TIME
+    if animation_count * MIN_RUN_TIME > available:
+        raise ValueError(f"{animation_count} animations do not fit in {duration} seconds")
+    # Round down so the rendered segment never exceeds its duration
+    run_time = math.floor(max(MIN_RUN_TIME, min(1.0, 0.5 * available / animation_count)) * 100) / 100
+    wait_time = math.floor((available - run_time * animation_count + MIN_WAIT_TIME) * 100) / 100
+    return run_time, wait_time
+
+def _heading_lines(heading):
+    """Source lines for an optional heading pinned to the top edge."""
+    if heading is None:
+        return [], []
+    return (
+        [f"heading = _fit(Text({heading!r}, font_size=44, color=BLUE)).to_edge(UP)"],
+        ["heading"],
+    )
+
+def _title_card(params, duration):
+    """Draw a large title, optionally with a subtitle underneath."""
+    title = _text(params, "title")
+    subtitle = _text(params, "subtitle", required=False)
+    run_time, wait_time = _timing(duration, 2 if subtitle else 1)
+    lines = [f"title = _fit(Text({title!r}, font_size=56, color=BLUE))"]
+    if subtitle:
+        lines += [
+            f"subtitle = _fit(Text({subtitle!r}, font_size=32))",
+            "VGroup(title, subtitle).arrange(DOWN, buff=0.5).move_to(ORIGIN)",
+            f"self.play(Write(title), run_time={run_time})",
+            f"self.play(FadeIn(subtitle, shift=UP * 0.2), run_time={run_time})",
+        ]
+    else:
+        lines.append(f"self.play(Write(title), run_time={run_time})")
+    lines.append(f"self.wait({wait_time})")
+    return lines
+
+def _bullet_list(params, duration):
+    """Draw an optional heading and reveal bullet points one at a time."""
+    heading = _text(params, "heading", required=False)
+    items = _text_list(params, "items", 1, MAX_LIST_ITEMS)
+    heading_lines, heading_names = _heading_lines(heading)
+    run_time, wait_time = _timing(duration, len(items) + len(heading_names))
+    lines = heading_lines + [
+        "items = VGroup(",
+        *[f"    Text({'- ' + item!r}, font_size=32)," for item in items],
+        ").arrange(DOWN, aligned_edge=LEFT, buff=0.4)",
+        "_fit(items, max_height=5.0)",
+        "items.next_to(heading, DOWN, buff=0.6)" if heading else "items.move_to(ORIGIN)",
+    ]
+    if heading:
+        lines.append(f"self.play(Write(heading), run_time={run_time})")
+    lines += [
+        "for item in items:",
+        f"    self.play(FadeIn(item, shift=RIGHT * 0.3), run_time={run_time})",
+        f"self.wait({wait_time})",
+    ]
+    return lines
+
+def _equation(params, duration):
+    """Write an equation in LaTeX, falling back to plain text, with an optional caption."""
+    latex = _text(params, "latex").strip("$")
+    plain_text = _text(params, "plain_text", required=False) or latex
+    caption = _text(params, "caption", required=False)
+    run_time, wait_time = _timing(duration, 2 if caption else 1)
+    lines = [
+        "try:",
+        f"    equation = MathTex({latex!r}, tex_template=TexTemplate(), font_size=64)",
+        "except Exception:",
+        "    # Fallback to plain text if LaTeX fails",
+        f"    equation = Text({plain_text!r}, font_size=48)",
+        "_fit(equation)",
+    ]
+    if caption:
+        lines += [
+            f"caption = _fit(Text({caption!r}, font_size=30))",
+            "VGroup(equation, caption).arrange(DOWN, buff=0.6).move_to(ORIGIN)",
+            f"self.play(Write(equation), run_time={run_time})",
+            f"self.play(FadeIn(caption), run_time={run_time})",
+        ]
+    else:
+        lines.append(f"self.play(Write(equation), run_time={run_time})")
+    lines.append(f"self.wait({wait_time})")
+    return lines
+
+def _shapes_diagram(params, duration):
+    """Draw basic shapes side by side with optional labels under each one."""
+    heading = _text(params, "heading", required=False)
+    shapes = params.get("shapes")
+    if not isinstance(shapes, list) or not 1 <= len(shapes) <= MAX_DIAGRAM_SHAPES:
+        raise ValueError(f"parameter 'shapes' must be a list of 1 to {MAX_DIAGRAM_SHAPES} shapes")
+    heading_lines, heading_names = _heading_lines(heading)
+    lines = list(heading_lines)
+    shape_names, label_names, item_names = [], [], []
+    for i, spec in enumerate(shapes):
+        if not isinstance(spec, dict):
+            raise ValueError("each shape must be an object")
+        kind = _displayable(spec.get("shape", ""), "shape").lower()
+        if kind not in SHAPES:
+            raise ValueError(f"unsupported shape '{kind}'")
+        color = COLORS.get(_displayable(spec.get("color", ""), "color").lower(),
+                           DEFAULT_COLOR_CYCLE[i % len(DEFAULT_COLOR_CYCLE)])
+        label = _text(spec, "label", required=False)
+        lines.append(f"shape_{i} = {SHAPES[kind].format(color=color)}")
+        shape_names.append(f"shape_{i}")
+        if label:
+            lines += [
+                f"label_{i} = _fit(Text({label!r}, font_size=28), max_width=3.0)",
+                f"label_{i}.next_to(shape_{i}, DOWN, buff=0.3)",
+            ]
+            label_names.append(f"label_{i}")
+            item_names.append(f"VGroup(shape_{i}, label_{i})")
+        else:
+            item_names.append(f"shape_{i}")
+    lines += [
+        f"diagram = VGroup({', '.join(item_names)}).arrange(RIGHT, buff=0.8)",
+        "_fit(diagram, max_height=5.0)",
+        "diagram.next_to(heading, DOWN, buff=0.8)" if heading else "diagram.move_to(ORIGIN)",
+    ]
+    run_time, wait_time = _timing(duration, 1 + bool(label_names) + len(heading_names))
+    if heading:
+        lines.append(f"self.play(Write(heading), run_time={run_time})")
+    lines.append(f"self.play({', '.join(f'Create({name})' for name in shape_names)}, run_time={run_time})")
+    if label_names:
+        lines.append(f"self.play({', '.join(f'Write({name})' for name in label_names)}, run_time={run_time})")
+    lines.append(f"self.wait({wait_time})")
+    return lines
+
+def _process_steps(params, duration):
+    """Draw process steps as boxes joined by arrows, revealed left to right."""
+    heading = _text(params, "heading", required=False)
+    steps = _text_list(params, "steps", 2, MAX_PROCESS_STEPS)
+    heading_lines, heading_names = _heading_lines(heading)
+    run_time, wait_time = _timing(duration, len(steps) + len(heading_names))
+    lines = heading_lines + ["steps = VGroup()"]
+    for step in steps:
+        lines += [
+            "box = Rectangle(width=2.8, height=1.4, color=BLUE)",
+            f"label = _fit(Text({step!r}, font_size=26), max_width=2.5, max_height=1.2).move_to(box)",
+            "steps.add(VGroup(box, label))",
+        ]
+    lines += [
+        "steps.arrange(RIGHT, buff=0.7)",
+        "_fit(steps, max_height=5.0)",
+        "steps.next_to(heading, DOWN, buff=1.0)" if heading else "steps.move_to(ORIGIN)",
+        "arrows = [",
+        "    Line(left.get_right(), right.get_left(), buff=0.1).add_tip(tip_length=0.2)",
+        "    for left, right in zip(steps[:-1], steps[1:])",
+        "]",
+    ]
+    if heading:
+        lines.append(f"self.play(Write(heading), run_time={run_time})")
+    lines += [
+        f"self.play(Create(steps[0][0]), Write(steps[0][1]), run_time={run_time})",
+        "for arrow, step in zip(arrows, steps[1:]):",
+        f"    self.play(Create(arrow), Create(step[0]), Write(step[1]), run_time={run_time})",
+        f"self.wait({wait_time})",
+    ]
+    return lines
+
+TEMPLATES = {
+    "title_card": _title_card,
+    "bullet_list": _bullet_list,
+    "equation": _equation,
+    "shapes_diagram": _shapes_diagram,
+    "process_steps": _process_steps,
+}
+
+def render_segment(segment, method_name, max_duration):
+    """Fill in the template for a segment, returning method source or None if no template covers it."""
+    segment_type = segment.get("segment_type", CUSTOM_SEGMENT_TYPE)
+    template = TEMPLATES.get(segment_type) if isinstance(segment_type, str) else None
+    if template is None:
+        return None
+    params = segment.get("parameters")
+    if not isinstance(params, dict):
+        params = {}
+    try:
+        duration = _duration(segment.get("duration_seconds", 5), max_duration)
+        body = template(params, duration)
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Segment '{method_name}' does not fit the '{segment_type}' template ({str(e)}). Using generated code instead.")
+        return None
+    body.append("_clear(self)")
+    return "\n".join(
+        [f"    def {method_name}(self):"] + [f"        {line}" for line in body]
+    )
+
+def build_scene_code(segment_count, template_methods, custom_code=""):
+    """Assemble the ExplanationScene source from template methods and generated custom segment functions.
+
+    template_methods maps a segment index to the method rendered by render_segment().
+    Every other segment must be defined in custom_code as a function named custom_segment_<index>(self).
+    """
+    construct_calls = [
+        f"        self.segment_{i}()" if i in template_methods else f"        custom_segment_{i}(self)"
+        for i in range(segment_count)
+    ]
+    parts = [SCENE_HEADER]
+    if custom_code:
+        parts.append(custom_code.strip() + "\n")
+    scene_code = "\n".join(
+        ["class ExplanationScene(Scene):", "    def construct(self):"]
+        + (construct_calls or ["        self.wait(1)"])
+    )
+    parts.append("\n\n".join([scene_code] + [template_methods[i] for i in sorted(template_methods)]) + "\n")
+    return "\n\n".join(parts)
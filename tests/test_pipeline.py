@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModel:
+    """Return canned Gemini responses in order and record the prompts."""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        return FakeResponse(self.responses.pop(0))
+
+def make_script():
+    """A script with one templated segment and one custom segment."""
+    return {
+        "title": "Title",
+        "segments": [
+            {"narration": "Hi", "visual_description": "Title", "duration_seconds": 4,
+             "segment_type": "title_card", "parameters": {"title": "Hi"}},
+            {"narration": "Wave", "visual_description": "A wave", "duration_seconds": 4,
+             "segment_type": "custom", "parameters": {}},
+        ],
+    }
+
+FULL_SCENE = "class ExplanationScene(Scene):\n    def construct(self):\n        self.wait(8)\n"
+
+class GenerateManimCodeTest(unittest.TestCase):
+    def test_mixed_mode_uses_custom_functions(self):
+        model = FakeModel("```python\ndef custom_segment_1(self):\n    self.wait(4)\n```")
+        code = pipeline.generate_manim_code(make_script(), model)
+        self.assertEqual(len(model.prompts), 1)
+        self.assertIn("custom_segment_1(self)", code)
+        self.assertIn("def segment_0(self):", code)
+
+    def test_missing_custom_function_falls_back_to_full_scene(self):
+        model = FakeModel("def some_other_name(self):\n    self.wait(4)\n", FULL_SCENE)
+        code = pipeline.generate_manim_code(make_script(), model)
+        self.assertEqual(len(model.prompts), 2)
+        self.assertEqual(code, FULL_SCENE)
+
+    def test_missing_functions(self):
+        code = "def custom_segment_1(self):\n    pass\n"
+        self.assertEqual(pipeline.missing_functions(code, ["custom_segment_1", "custom_segment_3"]), ["custom_segment_3"])
+        self.assertEqual(pipeline.missing_functions("def (", ["custom_segment_1"]), ["custom_segment_1"])
+
+if __name__ == "__main__":
+    unittest.main()
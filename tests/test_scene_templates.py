@@ -0,0 +1,143 @@
+import ast
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scene_templates
+
+MAX_DURATION = 60
+
+SEGMENTS = {
+    "title_card": {"title": "Photosynthesis", "subtitle": "How plants use light"},
+    "bullet_list": {"heading": "Ingredients", "items": ["Light", "Water", "Carbon dioxide"]},
+    "equation": {
+        "latex": r"$6CO_2 + 6H_2O \rightarrow C_6H_{12}O_6 + 6O_2$",
+        "plain_text": "6CO2 + 6H2O -> C6H12O6 + 6O2",
+        "caption": "Overall reaction",
+    },
+    "shapes_diagram": {
+        "heading": "Parts",
+        "shapes": [{"shape": "circle", "label": "Sun", "color": "yellow"}, {"shape": "dot"}],
+    },
+    "process_steps": {"steps": ["Absorb light", "Split water", "Make sugar"]},
+}
+
+def make_segment(segment_type, parameters, duration_seconds=6):
+    """Build a script segment the way generate_script returns it."""
+    return {
+        "narration": "Narration",
+        "visual_description": "Visual",
+        "duration_seconds": duration_seconds,
+        "segment_type": segment_type,
+        "parameters": parameters,
+    }
+
+def render(segment, method_name="segment_0"):
+    """Render a segment with the pipeline's duration cap."""
+    return scene_templates.render_segment(segment, method_name, MAX_DURATION)
+
+def wait_times(code):
+    """Collect the literal durations passed to self.wait() in the generated source."""
+    return [node.args[0].value for node in ast.walk(ast.parse(code))
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and node.func.attr == "wait" and isinstance(node.args[0], ast.Constant)]
+
+def string_constants(code):
+    """Collect every string literal in the generated source."""
+    return {node.value for node in ast.walk(ast.parse(code))
+            if isinstance(node, ast.Constant) and isinstance(node.value, str)}
+
+class RenderSegmentTest(unittest.TestCase):
+    def test_each_template_builds_valid_scene(self):
+        for segment_type, parameters in SEGMENTS.items():
+            with self.subTest(segment_type=segment_type):
+                method = render(make_segment(segment_type, parameters))
+                self.assertIsNotNone(method)
+                code = scene_templates.build_scene_code(1, {0: method})
+                tree = ast.parse(code)
+                scene = next(node for node in tree.body
+                             if isinstance(node, ast.ClassDef) and node.name == "ExplanationScene")
+                self.assertEqual([node.name for node in scene.body], ["construct", "segment_0"])
+
+    def test_mixed_template_and_custom_segments(self):
+        segments = [make_segment(segment_type, parameters) for segment_type, parameters in SEGMENTS.items()]
+        segments.insert(2, make_segment(scene_templates.CUSTOM_SEGMENT_TYPE, {}))
+        template_methods = {}
+        for i, segment in enumerate(segments):
+            method = render(segment, f"segment_{i}")
+            if method is not None:
+                template_methods[i] = method
+        self.assertEqual(sorted(template_methods), [0, 1, 3, 4, 5])
+        custom_code = "from manim import Circle\n\ndef custom_segment_2(self):\n    self.wait(1)\n"
+        code = scene_templates.build_scene_code(len(segments), template_methods, custom_code)
+        tree = ast.parse(code)
+        self.assertIn("custom_segment_2", [node.name for node in tree.body if isinstance(node, ast.FunctionDef)])
+        self.assertIn("custom_segment_2(self)", code)
+
+    def test_invalid_parameters_fall_back(self):
+        cases = [
+            make_segment("bullet_list", {"items": "Light, Water"}),
+            make_segment("shapes_diagram", {"shapes": [{"shape": "hexagon"}]}),
+            make_segment("title_card", {"title": "Title"}, duration_seconds="a while"),
+            make_segment("process_steps", {"steps": ["Only one step"]}),
+            make_segment("title_card", {"title": "Title"}, duration_seconds="inf"),
+            make_segment("title_card", {"title": "Title"}, duration_seconds="nan"),
+            make_segment("title_card", {"title": "Title"}, duration_seconds=1e309),
+            make_segment("bullet_list", {"items": [None, {"a": 1}]}),
+            make_segment("bullet_list", {"items": ["Light", ["nested"]]}),
+            make_segment("title_card", {"title": {"text": "Title"}}),
+            make_segment("bullet_list", {"items": [f"Item {i}" for i in range(8)]}, duration_seconds=2),
+            make_segment(["bullet_list"], {"items": ["Light"]}),
+            make_segment("unknown_type", {}),
+        ]
+        for segment in cases:
+            with self.subTest(segment=segment):
+                self.assertIsNone(render(segment))
+
+    def test_duration_is_capped(self):
+        method = render(make_segment("title_card", {"title": "Title"}, duration_seconds=100))
+        code = scene_templates.build_scene_code(1, {0: method})
+        self.assertLessEqual(sum(wait_times(code)), MAX_DURATION)
+
+    def test_segment_fits_its_duration(self):
+        for duration in (1.5, 3, 4.2, 10):
+            for count in range(1, scene_templates.MAX_LIST_ITEMS + 1):
+                try:
+                    run_time, wait_time = scene_templates._timing(duration, count)
+                except ValueError:
+                    continue
+                with self.subTest(duration=duration, count=count):
+                    self.assertGreater(wait_time, 0)
+                    self.assertLessEqual(run_time * count + wait_time + scene_templates.CLEAR_RUN_TIME, duration + 1e-9)
+
+    def test_quotes_in_text_become_literals(self):
+        title = 'It\'s "quoted" \\ text'
+        method = render(make_segment("title_card", {"title": title}))
+        code = scene_templates.build_scene_code(1, {0: method})
+        self.assertIn(title, string_constants(code))
+
+@unittest.skipUnless(importlib.util.find_spec("manim"), "manim is not installed")
+class ManimRenderTest(unittest.TestCase):
+    def test_each_template_renders(self):
+        for segment_type, parameters in SEGMENTS.items():
+            with self.subTest(segment_type=segment_type):
+                code = scene_templates.build_scene_code(1, {0: render(make_segment(segment_type, parameters))})
+                with tempfile.TemporaryDirectory() as scene_dir:
+                    scene_path = os.path.join(scene_dir, "explanation_scene.py")
+                    with open(scene_path, "w", encoding="utf-8") as f:
+                        f.write(code)
+                    result = subprocess.run(
+                        [sys.executable, "-m", "manim", "-ql", "--dry_run", scene_path, "ExplanationScene"],
+                        cwd=scene_dir,
+                        capture_output=True,
+                        text=True,
+                    )
+                self.assertEqual(result.returncode, 0, result.stderr)
+
+if __name__ == "__main__":
+    unittest.main()
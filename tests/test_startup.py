@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["moviepy", "gtts", "google.generativeai"]
+MAX_IMPORT_SECONDS = 1.0
+
+# Streamlit reruns vid.py on every interaction, so importing the pipeline
+# (and everything it pulls in at module level) must stay cheap.
+IMPORT_CHECK = f"""
+import json, sys, time
+start = time.perf_counter()
+import pipeline
+elapsed = time.perf_counter() - start
+loaded = [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "loaded": loaded}}))
+"""
+
+class StartupImportTest(unittest.TestCase):
+    def run_import_check(self):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_CHECK],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout)
+        return report["elapsed"], report["loaded"]
+
+    def test_pipeline_import_skips_heavy_dependencies(self):
+        _, loaded = self.run_import_check()
+        self.assertEqual(loaded, [], f"pipeline imports heavy dependencies at module level: {loaded}")
+
+    def test_pipeline_import_time(self):
+        elapsed, _ = self.run_import_check()
+        self.assertLess(elapsed, MAX_IMPORT_SECONDS)
+
+if __name__ == "__main__":
+    unittest.main()